@@ -5,24 +5,26 @@ from shiny.express import input, render, ui
 from shiny import reactive
 from shinywidgets import render_plotly
 import datetime
-from collections import deque
-import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 from pathlib import Path
+import sys
 import time
 from shiny import express
 import matplotlib.pyplot as plt
 import seaborn as sns
+from history import WeatherHistory
+from weather_api import FETCH_WORKERS, TEXAS_CITIES, WEATHER_URL, http_session, latest_weather
 
 # Configuration
 API_KEY = "{api_weather_key}"
-TEXAS_CITIES = [
-    "Houston", "San Antonio", "Dallas", "Austin", "Fort Worth",
-    "El Paso", "Arlington", "Corpus Christi", "Plano", "Laredo",
-    "Lubbock", "Garland", "Irving", "Amarillo", "Grand Prairie"
-]
 UNITS = "metric"
 MAX_HISTORY = 1000  # Increased to accommodate multiple cities
-HISTORY_FILE = "weather_history.json"
+HISTORY_FILE = "weather_history.ndjson"  # One JSON record per line
+LEGACY_HISTORY_FILE = "weather_history.json"  # Single JSON list, migrated on start
+CACHE_TTL = 300  # Seconds before a city is fetched again from the API
+FIGURE_CACHE_SIZE = 8  # Plotly figures kept for reuse across renders
 
 # Metric labels for display
 METRIC_LABELS = {
@@ -32,28 +34,67 @@ METRIC_LABELS = {
     "wind_speed": "Wind Speed (m/s)"
 }
 
-# Function to fetch weather data for all Texas cities
+# Name, icon, theme and value format of each metric's value box
+METRIC_DISPLAY = {
+    "temperature": ("Temperature", "bi-thermometer", "primary", "{}°C"),
+    "humidity": ("Humidity", "bi-droplet", "info", "{:g}%"),
+    "pressure": ("Pressure", "bi-speedometer2", "warning", "{:g} hPa"),
+    "wind_speed": ("Wind Speed", "bi-wind", "success", "{} m/s")
+}
+
+# Function to fetch weather data for a single Texas city
+def fetch_city_weather(city):
+    params = {"q": f"{city},TX,US", "appid": API_KEY, "units": UNITS}
+    try:
+        response = http_session.get(WEATHER_URL, params=params, timeout=10)
+        response.raise_for_status()
+        data = response.json()
+        return {
+            "city": city,
+            "temperature": data['main']['temp'],
+            "humidity": data['main']['humidity'],
+            "pressure": data['main']['pressure'],
+            "wind_speed": data['wind']['speed'],
+            "weather_condition": data['weather'][0]['main'],
+            "timestamp": datetime.datetime.now().replace(microsecond=0)
+        }
+    except (requests.RequestException, KeyError) as e:
+        print(f"Error fetching weather for {city}: {e}")
+        return None
+
+# Function to fetch weather data for all Texas cities concurrently,
+# skipping cities that were fetched within the last CACHE_TTL seconds.
+# Returns only the records fetched by this call; every city's latest
+# record is kept in latest_weather.
 def fetch_all_texas_weather():
-    weather_data = []
-    for city in TEXAS_CITIES:
-        url = f"https://api.openweathermap.org/data/2.5/weather?q={city},TX,US&appid={API_KEY}&units={UNITS}"
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            weather_data.append({
-                "city": city,
-                "temperature": data['main']['temp'],
-                "humidity": data['main']['humidity'],
-                "pressure": data['main']['pressure'],
-                "wind_speed": data['wind']['speed'],
-                "weather_condition": data['weather'][0]['main'],
-                "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
-        except (requests.RequestException, KeyError) as e:
-            print(f"Error fetching weather for {city}: {e}")
+    now = time.time()
+    stale_cities = [
+        city for city in TEXAS_CITIES
+        if now - latest_weather.get(city, (0, None))[0] >= CACHE_TTL
+    ]
+    if not stale_cities:
+        return []
+    if sys.platform == "emscripten":
+        # Pyodide (the shinylive export in docs/) cannot start threads
+        results = map(fetch_city_weather, stale_cities)
+    else:
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            results = executor.map(fetch_city_weather, stale_cities)
+    weather_data = [record for record in results if record]
+    for record in weather_data:
+        latest_weather[record["city"]] = (now, record)
     return weather_data
 
+# Latest records, possibly fetched by another browser session, that are
+# newer than anything the given history holds for their city
+def unseen_weather(history):
+    latest = history.latest_timestamps()
+    return [
+        record
+        for _, record in (latest_weather[city] for city in TEXAS_CITIES if city in latest_weather)
+        if record["city"] not in latest or record["timestamp"] > latest[record["city"]]
+    ]
+
 # UI Setup
 ui.page_opts(title="Texas Weather Dashboard - Femi", fillable=True)
 
@@ -79,61 +120,135 @@ with express.ui.sidebar(open="open"):
     ui.a("OpenWeatherMap API", href="https://openweathermap.org/api", target="_blank")
 
 # Reactive data storage with file persistence
-weather_history = reactive.Value(deque(maxlen=MAX_HISTORY))
+weather_history = reactive.Value(WeatherHistory(MAX_HISTORY))
+history_version = reactive.Value(0)
+
+# Bump the history version so calculations and cached figures built from
+# the previous history are discarded
+def bump_history_version():
+    with reactive.isolate():
+        history_version.set(history_version.get() + 1)
+
+# Most recently used Plotly figures, keyed on the inputs they were built from
+figure_cache = OrderedDict()
+
+def cached_figure(key):
+    if key in figure_cache:
+        figure_cache.move_to_end(key)
+        return figure_cache[key]
+    return None
+
+def store_figure(key, fig):
+    figure_cache[key] = fig
+    if len(figure_cache) > FIGURE_CACHE_SIZE:
+        figure_cache.popitem(last=False)
+    return fig
+
+# Number of records currently stored in the history file
+history_file_lines = 0
+
+# Rewrite the history file with only the given records
+def write_history(records):
+    global history_file_lines
+    with open(HISTORY_FILE, "wb") as f:
+        f.writelines(orjson.dumps(record) + b"\n" for record in records)
+    history_file_lines = len(records)
+
+# Append new records to the end of the history file
+def append_history(records):
+    global history_file_lines
+    with open(HISTORY_FILE, "ab") as f:
+        f.writelines(orjson.dumps(record) + b"\n" for record in records)
+    history_file_lines += len(records)
 
 # Load initial history from file or fetch initial data
 @reactive.Effect
 def load_initial_history():
+    global history_file_lines
+    if not Path(HISTORY_FILE).exists() and Path(LEGACY_HISTORY_FILE).exists():
+        with open(LEGACY_HISTORY_FILE, "rb") as f:
+            write_history(orjson.loads(f.read())[-MAX_HISTORY:])
     if Path(HISTORY_FILE).exists():
-        with open(HISTORY_FILE, "r") as f:
-            history = json.load(f)
-            weather_history.set(deque(history, maxlen=MAX_HISTORY))
+        with open(HISTORY_FILE, "rb") as f:
+            lines = [line for line in f if line.strip()]
+        if lines and not lines[-1].endswith(b"\n"):
+            # The last append was cut off: keep the record only if it is
+            # complete, and rewrite the file so the next append starts on a
+            # new line
+            try:
+                orjson.loads(lines[-1])
+                lines[-1] += b"\n"
+            except orjson.JSONDecodeError:
+                lines.pop()
+            with open(HISTORY_FILE, "wb") as f:
+                f.writelines(lines)
+        history_file_lines = len(lines)
+        history = WeatherHistory(MAX_HISTORY)
+        history.extend(orjson.loads(line) for line in lines[-MAX_HISTORY:])
+        weather_history.set(history)
+        bump_history_version()
     else:
-        initial_data = fetch_all_texas_weather()
-        weather_history.set(deque(initial_data, maxlen=MAX_HISTORY))
-        with open(HISTORY_FILE, "w") as f:
-            json.dump(initial_data, f)
-
-# Reactive calculation for filtered history
-@reactive.calc
-def filtered_history():
-    history = list(weather_history.get())
-    hours = input.history_hours()
-    return history[-hours:] if hours <= len(history) else history
+        fetch_all_texas_weather()
+        history = WeatherHistory(MAX_HISTORY)
+        initial_data = unseen_weather(history)
+        history.extend(initial_data)
+        weather_history.set(history)
+        bump_history_version()
+        write_history(initial_data)
 
 # Reactive effect for fetching and saving data for all cities
 @reactive.Effect
 @reactive.event(input.update_btn)
 def update_weather():
-    new_data = fetch_all_texas_weather()
-    if new_data:
-        current_history = weather_history.get()
-        current_history.extend(new_data)  # Add all new data points
-        
-        with open(HISTORY_FILE, "w") as f:
-            json.dump(list(current_history), f)
-        
-        weather_history.set(current_history)
+    fetched = fetch_all_texas_weather()
+    current_history = weather_history.get()
+    new_data = unseen_weather(current_history)
+    if not new_data:
+        ui.notification_show(
+            f"No new weather data yet; each city is refreshed at most every {CACHE_TTL // 60} minutes.",
+            type="message"
+        )
+        return
+    
+    current_history.extend(new_data)  # Add all new data points
+    
+    # Only records fetched here are written, since records fetched by other
+    # sessions are already in the file; the file is compacted back down to
+    # the in-memory history once it holds twice as many records
+    if fetched:
+        append_history(fetched)
+        if history_file_lines > 2 * MAX_HISTORY:
+            write_history(current_history.records())
+    
+    weather_history.set(current_history)
+    # The history is mutated in place, so bump the version to invalidate
+    bump_history_version()
 
 # Reactive calculations for DataFrames
+# Only the rows that are displayed are copied out of the history buffers
 @reactive.calc
 def current_weather_df():
+    history_version.get()
     history = weather_history.get()
-    # Get most recent entry for each city
+    # Get most recent entry for each city from the history's city index
     if history:
-        df = pd.DataFrame(history)
-        return df.sort_values('timestamp').groupby('city').last().reset_index()
+        return history.to_frame(history.latest_positions())
     return pd.DataFrame()
 
+# Snapshot of everything the focused city views are built from; the city
+# DataFrame and the cached figures are all keyed on this one tuple
 @reactive.calc
-def history_df():
-    return pd.DataFrame(filtered_history())
+def focused_city_key():
+    return (history_version.get(), input.selected_city(), input.history_hours())
 
 @reactive.calc
 def focused_city_df():
-    df = history_df()
-    if not df.empty:
-        return df[df['city'] == input.selected_city()]
+    _, city, hours = focused_city_key()
+    history = weather_history.get()
+    # Only the selected city's rows inside the history window are taken
+    rows = history.city_positions(city, hours)
+    if len(rows):
+        return history.to_frame(rows)
     return pd.DataFrame()
 
 # Loading spinner
@@ -168,13 +283,17 @@ with ui.layout_columns():
 with express.ui.layout_columns():
     @render_plotly
     def weather_trend():
-        df = focused_city_df()
         selected_metric = input.selected_metric()
+        key = ("trend", *focused_city_key(), selected_metric)
+        fig = cached_figure(key)
+        if fig is not None:
+            return fig
         
+        df = focused_city_df()
         if df.empty:
             return px.scatter(title="No data available").update_layout(showlegend=False)
         
-        return px.line(
+        return store_figure(key, px.line(
             df,
             x="timestamp",
             y=selected_metric,
@@ -184,7 +303,7 @@ with express.ui.layout_columns():
                 "timestamp": "Time",
                 selected_metric: METRIC_LABELS[selected_metric]
             }
-        ).update_traces(mode="lines+markers")
+        ).update_traces(mode="lines+markers"))
 
     @render.ui
     def weather_conditions():
@@ -195,45 +314,16 @@ with express.ui.layout_columns():
             return ui.tags.div("No data available", class_="text-muted")
         
         current = df.iloc[-1]
-        metric_config = {
-            "temperature": {
-                "title": f"Temperature in {current['city']}",
-                "value": f"{current['temperature']}°C",
-                "icon": "bi-thermometer",
-                "theme": "primary"
-            },
-            "humidity": {
-                "title": f"Humidity in {current['city']}",
-                "value": f"{current['humidity']}%",
-                "icon": "bi-droplet",
-                "theme": "info"
-            },
-            "pressure": {
-                "title": f"Pressure in {current['city']}",
-                "value": f"{current['pressure']} hPa",
-                "icon": "bi-speedometer2",
-                "theme": "warning"
-            },
-            "wind_speed": {
-                "title": f"Wind Speed in {current['city']}",
-                "value": f"{current['wind_speed']} m/s",
-                "icon": "bi-wind",
-                "theme": "success"
-            }
-        }
-        
-        config = metric_config.get(selected_metric, {
-            "title": selected_metric.capitalize(),
-            "value": str(current.get(selected_metric, "N/A")),
-            "icon": "bi-question-circle",
-            "theme": "secondary"
-        })
+        name, icon, theme, value_format = METRIC_DISPLAY.get(
+            selected_metric,
+            (selected_metric.capitalize(), "bi-question-circle", "secondary", "{}")
+        )
         
         return ui.value_box(
-            title=config["title"],
-            value=config["value"],
-            showcase=ui.tags.i(class_=f"bi {config['icon']}"),
-            theme=config["theme"],
+            title=f"{name} in {current['city']}",
+            value=value_format.format(current.get(selected_metric, "N/A")),
+            showcase=ui.tags.i(class_=f"bi {icon}"),
+            theme=theme,
             full_screen=True
         )
 
@@ -241,24 +331,27 @@ with express.ui.card(full_screen=True):
     express.ui.card_header("Texas Cities: Metrics Correlation")
     @render_plotly
     def weather_correlation():
-        df = focused_city_df()
-        selected_metric = input.selected_metric()
+        # The scatter matrix does not depend on the selected metric
+        key = ("correlation", *focused_city_key())
+        fig = cached_figure(key)
+        if fig is not None:
+            return fig
         
+        df = focused_city_df()
         if df.empty:
             return px.scatter(title="No data available").update_layout(showlegend=False)
         
-        return px.scatter_matrix(
+        return store_figure(key, px.scatter_matrix(
             df,
             dimensions=list(METRIC_LABELS.keys()),
             color="city",
             title="Texas Cities: Metrics Correlation",
             labels=METRIC_LABELS
-        )
+        ))
 
     # Update available metrics based on data
     @reactive.Effect
     def update_metric_filter():
-        df = history_df()
-        if not df.empty:
-            available_metrics = [col for col in METRIC_LABELS.keys() if col in df.columns]
-            express.ui.update_selectize("selected_metric", choices=available_metrics)
\ No newline at end of file
+        # Every record carries all metrics, so only check that data exists
+        if weather_history.get():
+            express.ui.update_selectize("selected_metric", choices=list(METRIC_LABELS.keys()))
\ No newline at end of file
@@ -0,0 +1,111 @@
+from collections import defaultdict, deque
+
+import numpy as np
+import pandas as pd
+
+# Column layout of a weather record. Text columns are kept as Python
+# objects so long names are never truncated, and all metrics are floats so
+# no fractional part is dropped.
+COLUMN_DTYPES = {
+    "city": object,
+    "temperature": np.float64,
+    "humidity": np.float64,
+    "pressure": np.float64,
+    "wind_speed": np.float64,
+    "weather_condition": object,
+    "timestamp": "datetime64[s]",
+}
+
+# Columns with few distinct values, stored as categoricals in DataFrames
+CATEGORY_COLUMNS = ("city", "weather_condition")
+
+
+class WeatherHistory:
+    """Fixed-size weather history stored as one NumPy array per column.
+
+    The arrays hold twice ``maxlen`` rows. New records are written after the
+    last one and, once the arrays are full, the newest ``maxlen`` rows are
+    moved back to the front, so the live history is always the contiguous
+    slice ``[start:end]``.
+
+    Every record gets a sequence number, and ``city_rows`` keeps the sequence
+    numbers of the live rows for each city so a city's rows can be located
+    without scanning the city column.
+    """
+
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self.columns = {
+            name: np.empty(2 * maxlen, dtype=dtype)
+            for name, dtype in COLUMN_DTYPES.items()
+        }
+        self.start = 0
+        self.end = 0
+        self.written = 0
+        self.city_rows = defaultdict(deque)
+
+    def __len__(self):
+        return self.end - self.start
+
+    def extend(self, records):
+        for record in records:
+            if self.end == 2 * self.maxlen:
+                self._compact()
+            for name, column in self.columns.items():
+                column[self.end] = record[name]
+            self.city_rows[self.columns["city"][self.end]].append(self.written)
+            self.end += 1
+            self.written += 1
+            if self.end - self.start > self.maxlen:
+                self.city_rows[self.columns["city"][self.start]].popleft()
+                self.start += 1
+
+    def _compact(self):
+        size = len(self)
+        for column in self.columns.values():
+            column[:size] = column[self.start:self.end]
+        self.start, self.end = 0, size
+
+    def city_positions(self, city, last=None):
+        """Row positions of ``city`` within the newest ``last`` rows."""
+        first_seq = self.written - len(self)
+        window_seq = self.written - min(last or len(self), len(self))
+        positions = []
+        for seq in reversed(self.city_rows.get(city, ())):
+            if seq < window_seq:
+                break
+            positions.append(seq - first_seq)
+        return np.array(positions[::-1], dtype=np.intp)
+
+    def latest_positions(self):
+        """Row position of the newest record for each city, ordered by city."""
+        first_seq = self.written - len(self)
+        return [
+            self.city_rows[city][-1] - first_seq
+            for city in sorted(self.city_rows)
+            if self.city_rows[city]
+        ]
+
+    def latest_timestamps(self):
+        """Timestamp of the newest record for each city."""
+        first_seq = self.written - len(self)
+        timestamps = self.columns["timestamp"][self.start:self.end]
+        return {
+            city: timestamps[rows[-1] - first_seq].item()
+            for city, rows in self.city_rows.items()
+            if rows
+        }
+
+    def records(self):
+        values = [column[self.start:self.end].tolist() for column in self.columns.values()]
+        return [dict(zip(self.columns, row)) for row in zip(*values)]
+
+    def to_frame(self, positions=None):
+        """DataFrame of the history, or of only the rows at ``positions``."""
+        frame = {}
+        for name, column in self.columns.items():
+            values = column[self.start:self.end]
+            if positions is not None:
+                values = values[positions]
+            frame[name] = pd.Categorical(values) if name in CATEGORY_COLUMNS else values
+        return pd.DataFrame(frame)
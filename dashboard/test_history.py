@@ -0,0 +1,91 @@
+import datetime
+import random
+from collections import deque
+
+import pytest
+
+from history import WeatherHistory
+
+CITIES = ["Houston", "Dallas", "Plano", "A City With A Very Long Name"]
+
+
+def make_record(n, city):
+    return {
+        "city": city,
+        "temperature": n + 0.25,
+        "humidity": n + 0.5,
+        "pressure": 1000 + n,
+        "wind_speed": n / 10,
+        "weather_condition": "Clouds",
+        "timestamp": datetime.datetime(2025, 7, 21) + datetime.timedelta(minutes=n),
+    }
+
+
+def expected_positions(reference, city, last=None):
+    window = len(reference) - min(last or len(reference), len(reference))
+    return [
+        i for i, record in enumerate(reference)
+        if record["city"] == city and i >= window
+    ]
+
+
+def expected_latest(reference):
+    latest = {record["city"]: i for i, record in enumerate(reference)}
+    return [latest[city] for city in sorted(latest)]
+
+
+@pytest.mark.parametrize("batch_size", [1, 4, 7])
+def test_matches_deque_reference_past_wraparound(batch_size):
+    maxlen = 5
+    history = WeatherHistory(maxlen)
+    reference = deque(maxlen=maxlen)
+    rng = random.Random(batch_size)
+
+    # Write enough records to wrap the 2 * maxlen buffers several times
+    n = 0
+    while n < 6 * maxlen:
+        batch = [make_record(n + i, rng.choice(CITIES)) for i in range(batch_size)]
+        n += batch_size
+        history.extend(batch)
+        reference.extend(batch)
+
+        assert len(history) == len(reference)
+        assert history.records() == list(reference)
+        for city in CITIES:
+            for last in (None, 1, 3, maxlen, 2 * maxlen):
+                assert list(history.city_positions(city, last)) == expected_positions(reference, city, last)
+        assert history.latest_positions() == expected_latest(reference)
+
+
+def test_to_frame_keeps_values_exact():
+    history = WeatherHistory(3)
+    records = [make_record(1, CITIES[-1]), make_record(2, "Dallas")]
+    history.extend(records)
+
+    df = history.to_frame()
+    assert list(df["city"]) == [CITIES[-1], "Dallas"]
+    assert list(df["humidity"]) == [1.5, 2.5]
+
+    focused = history.to_frame(history.city_positions(CITIES[-1]))
+    assert list(focused["city"]) == [CITIES[-1]]
+
+
+def test_empty_history():
+    history = WeatherHistory(3)
+    assert len(history) == 0
+    assert len(history.city_positions("Dallas")) == 0
+    assert history.latest_positions() == []
+    assert history.to_frame().empty
+
+
+def test_latest_timestamps():
+    history = WeatherHistory(3)
+    records = [make_record(n, city) for n, city in enumerate(["Dallas", "Plano", "Dallas", "Houston"])]
+    history.extend(records)
+
+    # The first Dallas record has been evicted, the second is the newest
+    assert history.latest_timestamps() == {
+        "Dallas": records[2]["timestamp"],
+        "Plano": records[1]["timestamp"],
+        "Houston": records[3]["timestamp"],
+    }
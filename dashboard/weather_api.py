@@ -0,0 +1,25 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Shiny Express runs app.py again for every browser session, so state that
+# should be shared by the whole process lives in this imported module.
+
+TEXAS_CITIES = [
+    "Houston", "San Antonio", "Dallas", "Austin", "Fort Worth",
+    "El Paso", "Arlington", "Corpus Christi", "Plano", "Laredo",
+    "Lubbock", "Garland", "Irving", "Amarillo", "Grand Prairie"
+]
+FETCH_WORKERS = len(TEXAS_CITIES)  # One worker per city, requests are network-bound
+WEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
+
+# HTTP session so connections to the API are reused across fetches
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(
+    pool_connections=FETCH_WORKERS,
+    pool_maxsize=FETCH_WORKERS,
+    max_retries=Retry(total=2, backoff_factor=0.3)
+))
+
+# Time and record of the last successful fetch per city
+latest_weather = {}
@@ -1,14 +1,16 @@
 from pathlib import Path
+import bottleneck as bn
 from plotly import graph_objects as go
 import cufflinks as cf
+import numpy as np
 import pandas as pd
 # from collections import deque
-import yfinance as yf
 from faicons import icon_svg
 from shiny import reactive
 from shiny.express import input, render, ui
 from shiny.ui import output_ui
 from shinywidgets import render_plotly
+from prices import fetch_history
 from stocks import stocks
 
 # Default to the last 6 months
@@ -29,22 +31,24 @@ with ui.layout_column_wrap(fill=False):
 
         @render.ui
         def price():
-            close = get_data()["Close"]
-            return f"{close.iloc[-1]:.2f}"
+            price, _, _ = get_price_summary()
+            return "N/A" if np.isnan(price) else f"{price:.2f}"
 
     with ui.value_box(showcase=output_ui("change_icon")):
         "Change"
 
         @render.ui
         def change():
-            return f"${get_change():.2f}"
+            _, change, _ = get_price_summary()
+            return f"${change:.2f}"
 
     with ui.value_box(showcase=icon_svg("percent")):
         "Percent Change"
 
         @render.ui
         def change_percent():
-            return f"{get_change_percent():.2f}%"
+            _, _, change_percent = get_price_summary()
+            return f"{change_percent:.2f}%"
 
 
 with ui.layout_columns(col_widths=[9, 3]):
@@ -60,7 +64,7 @@ with ui.layout_columns(col_widths=[9, 3]):
                 return go.Figure()
 
             # Add Simple Moving Average (SMA)
-            df["SMA"] = df["Close"].rolling(window=5).mean()
+            df["SMA"] = bn.move_mean(df["Close"].to_numpy(), window=5)
 
             fig = go.Figure()
 
@@ -131,39 +135,30 @@ with ui.layout_columns(col_widths=[9, 3]):
 ui.include_css(Path(__file__).parent / "styles.css")
 # ui.include_css(Path("dashboard") / "styles.css")
 
-@reactive.calc
-def get_ticker():
-    return yf.Ticker(input.ticker())
-
 
 @reactive.calc
 def get_data():
     dates = input.dates()
-    return get_ticker().history(start=dates[0], end=dates[1])
-
-
-@reactive.calc
-def get_change():
-    close = get_data()["Close"]
-    if len(close) < 2:
-        return 0.0
-    return close.iloc[-1] - close.iloc[-2]
+    return fetch_history(input.ticker(), dates[0], dates[1])
 
 
+# Latest close, change and percent change, computed together from one array
 @reactive.calc
-def get_change_percent():
-    close = get_data()["Close"]
+def get_price_summary():
+    close = get_data()["Close"].to_numpy()
+    if len(close) == 0:
+        return float("nan"), 0.0, 0.0
     if len(close) < 2:
-        return 0.0
-    change = close.iloc[-1] - close.iloc[-2]
-    return change / close.iloc[-2] * 100
+        return close[-1], 0.0, 0.0
+    change = close[-1] - close[-2]
+    return close[-1], change, change / close[-2] * 100
 
 
 with ui.hold():
 
     @render.ui
     def change_icon():
-        change = get_change()
+        _, change, _ = get_price_summary()
         icon = icon_svg("arrow-up" if change >= 0 else "arrow-down")
         icon.add_class(f"text-{('success' if change >= 0 else 'danger')}")
         return icon
@@ -0,0 +1,48 @@
+from collections import OrderedDict
+from datetime import date
+from pathlib import Path
+
+import yfinance as yf
+from joblib import Memory
+
+# Shiny Express runs app.py again for every browser session, so the price
+# history caches live in this imported module and are shared by the whole
+# process.
+
+# Price history downloads are cached on disk and, for quick re-hits, in
+# memory, keyed on the ticker and date range. yfinance treats the end date
+# as exclusive, so only ranges ending after today are still changing and
+# are always downloaded again.
+HISTORY_CACHE_SIZE = 32
+memory = Memory(Path(__file__).parent / ".yf_cache", verbose=0)
+history_cache = OrderedDict()
+
+
+def download_history(ticker, start, end):
+    return yf.Ticker(ticker).history(start=start, end=end)
+
+
+cached_download_history = memory.cache(download_history)
+
+
+def fetch_history(ticker, start, end):
+    key = (ticker, start, end)
+    if key in history_cache:
+        history_cache.move_to_end(key)
+        return history_cache[key]
+    # An open-ended range (a cleared date box) is left for yfinance to resolve
+    if start is None or end is None or end > date.today():
+        return download_history(ticker, start, end)
+
+    result = cached_download_history.call_and_shelve(ticker, start, end)
+    df = result.get()
+    if df.empty:
+        # yfinance returns an empty frame for failed downloads and unknown
+        # tickers, so don't keep it around
+        result.clear()
+        return df
+
+    history_cache[key] = df
+    if len(history_cache) > HISTORY_CACHE_SIZE:
+        history_cache.popitem(last=False)
+    return df